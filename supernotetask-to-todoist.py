@@ -13,45 +13,143 @@ in the current directory.
 """
 
 import sqlite3
-import csv
-import datetime
+import time
 import os
 import sys
 import base64
 import json
+import itertools
+import functools
+import pathlib
+import multiprocessing
+import collections
+
+# Bound once at import time; decode_metadata runs for every exported task
+_b64decode = base64.b64decode
+_json_loads = json.loads
+
+# Positions of the exported columns in the task table
+TABLE_TASK_ID_POS = 0
+TABLE_CONTENT_POS = 3
+TABLE_DUE_DATE_POS = 5
+TABLE_STATUS_POS = 8
+TABLE_REMINDER_DATE_POS = 9
+TABLE_METADATA_POS = 12  # Base64 encoded metadata
+
+# English month abbreviations for Todoist dates (what "%b" gives in the C locale)
+_MONTHS = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
+           'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+
+# Todoist priority written for every task (4 is the lowest priority)
+DEFAULT_PRIORITY = 4
+
+# Todoist CSV header line
+CSV_HEADER = "TYPE,CONTENT,DESCRIPTION,PRIORITY,DATE\n"
+
+# Number of tasks fetched from the database, converted and written to the
+# file in one go
+BATCH_ROWS = 4096
+
+# Exports with more tasks than this convert their batches in a process pool;
+# below it the cost of starting the workers outweighs the gain
+PARALLEL_THRESHOLD = 5000
+
+# Output buffer size; a large buffer means far fewer write() calls per export
+WRITE_BUFFER_SIZE = 1 << 20  # 1 MiB
 
 def connect_to_db(db_path):
-    """Connect to the SQLite database."""
+    """Connect to the SQLite database (read-only)."""
     try:
-        conn = sqlite3.connect(db_path)
+        # Open read-only so the export never takes a write lock on a database
+        # the Supernote app may have open at the same time
+        db_uri = pathlib.Path(db_path).resolve().as_uri() + "?mode=ro"
+        conn = sqlite3.connect(db_uri, uri=True, isolation_level=None)
+        
+        conn.execute("PRAGMA query_only = 1")
+        # 64 MiB page cache and up to 256 MiB of memory-mapped I/O
+        conn.execute("PRAGMA cache_size = -65536")
+        conn.execute("PRAGMA mmap_size = 268435456")
         return conn
     except sqlite3.Error as e:
         print(f"Error connecting to database: {e}")
         sys.exit(1)
 
 def get_active_tasks(conn):
-    """Get all tasks with 'needsAction' status from the database."""
+    """Query tasks with 'needsAction' status from the database.
+    
+    Returns a dict mapping each selected column name (id, content, due_date,
+    status, metadata) to its position in the rows, and an iterator that
+    yields the rows in lists of up to BATCH_ROWS tasks.
+    """
     try:
         cursor = conn.cursor()
-        cursor.execute("SELECT * FROM task WHERE status = 'needsAction'")
-        return cursor.fetchall()
+        
+        # Look up the names of the exported columns from their table positions,
+        # so only those columns are read instead of the whole row
+        names = [info[1] for info in cursor.execute("PRAGMA table_info(task)")]
+        
+        def column(pos):
+            if pos >= len(names):
+                return "NULL"
+            return '"{}"'.format(names[pos].replace('"', '""'))
+        
+        def is_empty(value):
+            # True for the values Python treats as false: NULL, empty text or
+            # blob, or a numeric zero in an untyped column
+            return (
+                f"({value} IS NULL OR {value} IN ('', x'') "
+                f"OR (typeof({value}) IN ('integer', 'real') AND {value} = 0))"
+            )
+        
+        # SQLite fills in the placeholder for tasks without content and
+        # falls back to the reminder date for tasks without a due date
+        content = column(TABLE_CONTENT_POS)
+        due_date = column(TABLE_DUE_DATE_POS)
+        reminder_date = column(TABLE_REMINDER_DATE_POS)
+        select_list = ", ".join((
+            f"{column(TABLE_TASK_ID_POS)} AS id",
+            f"CASE WHEN {is_empty(content)} THEN 'Untitled Task' "
+            f"ELSE {content} END AS content",
+            f"CASE WHEN NOT {is_empty(due_date)} THEN {due_date} "
+            f"WHEN NOT {is_empty(reminder_date)} THEN {reminder_date} END AS due_date",
+            f"{column(TABLE_STATUS_POS)} AS status",
+            f"{column(TABLE_METADATA_POS)} AS metadata",
+        ))
+        
+        cursor.execute(f"SELECT {select_list} FROM task WHERE status = 'needsAction'")
+    except sqlite3.Error as e:
+        print(f"Error querying tasks: {e}")
+        sys.exit(1)
+    
+    columns = {description[0]: pos for pos, description in enumerate(cursor.description)}
+    return columns, _iter_batches(cursor)
+
+def _iter_batches(cursor):
+    """Yield the rows of an executed query in lists of up to BATCH_ROWS rows."""
+    try:
+        # fetchmany returns an empty list once the rows run out
+        cursor.arraysize = BATCH_ROWS
+        yield from iter(cursor.fetchmany, [])
     except sqlite3.Error as e:
         print(f"Error querying tasks: {e}")
         sys.exit(1)
 
+@functools.lru_cache(maxsize=2048)
 def convert_timestamp_to_date(timestamp_ms):
-    """Convert Unix timestamp (milliseconds) to a Todoist-compatible date string."""
+    """Convert Unix timestamp (milliseconds) to a Todoist-compatible date string.
+    
+    Results are cached, since many tasks share the same due or reminder date.
+    """
     if not timestamp_ms:
         return ""
     
-    # Convert milliseconds to seconds
-    timestamp_sec = timestamp_ms / 1000
-    
-    # Convert to datetime
-    task_date = datetime.datetime.fromtimestamp(timestamp_sec)
+    # Convert milliseconds to seconds, then to a local-time struct_time
+    # (cheaper than building a datetime object)
+    task_date = time.localtime(timestamp_ms / 1000)
     
-    # Format according to Todoist expectations (e.g., "Apr 1 2025")
-    return task_date.strftime("%b %d %Y")
+    # Format according to Todoist expectations (e.g., "Apr 01 2025"),
+    # without going through the locale-aware strftime
+    return f"{_MONTHS[task_date.tm_mon - 1]} {task_date.tm_mday:02d} {task_date.tm_year}"
 
 def decode_metadata(metadata_base64):
     """Decode Base64 encoded metadata to extract file path and page."""
@@ -59,11 +157,8 @@ def decode_metadata(metadata_base64):
         return "", ""
     
     try:
-        # Decode Base64 to bytes, then convert to string
-        metadata_json = base64.b64decode(metadata_base64).decode('utf-8')
-        
-        # Parse JSON
-        metadata = json.loads(metadata_json)
+        # Decode Base64 to bytes and parse the JSON directly from the bytes
+        metadata = _json_loads(_b64decode(metadata_base64))
         
         # Extract file path and page
         file_path = metadata.get('filePath', '')
@@ -74,56 +169,124 @@ def decode_metadata(metadata_base64):
         print(f"Warning: Could not decode metadata: {e}")
         return "", ""
 
-def create_todoist_csv(tasks, output_file):
-    """Create a CSV file formatted for Todoist import."""
-    # Column positions (based on the database structure)
-    TASK_ID_POS = 0
-    TASK_CONTENT_POS = 3
-    DUE_DATE_POS = 5
-    STATUS_POS = 8
-    REMINDER_DATE_POS = 9
-    METADATA_POS = 12  # Base64 encoded metadata
+@functools.lru_cache(maxsize=4096)
+def _decode_cached(metadata_base64):
+    """Cached decode_metadata; many tasks point at the same note and page."""
+    return decode_metadata(metadata_base64)
+
+def _quote(field):
+    """Quote a CSV field only if it contains a comma, quote or line break."""
+    # SQLite columns are dynamically typed, so content may be a number or
+    # bytes; stringify it the way csv.writer did
+    if not isinstance(field, str):
+        field = str(field)
+    if '"' in field or ',' in field or '\n' in field or '\r' in field:
+        return '"' + field.replace('"', '""') + '"'
+    return field
+
+def make_row_builder(columns):
+    """Return a function that turns a task row into a Todoist CSV line.
     
-    # Todoist CSV headers
-    headers = ['TYPE', 'CONTENT', 'DESCRIPTION', 'PRIORITY', 'DATE']
+    columns maps column names to row positions, as returned by
+    get_active_tasks. The builder is set up once per batch of tasks, so
+    converting a row is a single straight-line call.
+    """
+    # Look up the column positions and bind the globals used for every row
+    # to closure variables once, so build_row does neither per row
+    content_pos, due_date_pos = columns['content'], columns['due_date']
+    metadata_pos = columns['metadata']
+    decode, quote = _decode_cached, _quote
+    convert = convert_timestamp_to_date
+    priority = DEFAULT_PRIORITY
+    
+    def build_row(task):
+        # Get task description (content)
+        content = task[content_pos]
+        
+        # Extract metadata for description
+        description = ""
+        metadata = task[metadata_pos]
+        if metadata:
+            file_path, page = decode(metadata)
+            if file_path:
+                # Extract just the filename from the (always '/'-separated)
+                # Supernote path
+                file_name = file_path.rpartition('/')[2]
+                description = f"Supernote Source: {file_name}, Page: {page}"
+        
+        # Get due date (already falling back to the reminder date)
+        due_date = convert(task[due_date_pos])
+        
+        # Always use the default (lowest) priority
+        # Fields are in the same order as the CSV headers; only the content
+        # and description are free text that may need quoting
+        return f"task,{quote(content)},{quote(description)},{priority},{due_date}\n"
+    
+    return build_row
+
+def process_batch(columns, tasks):
+    """Convert a list of tasks to CSV text; returns (task count, text)."""
+    return len(tasks), "".join(map(make_row_builder(columns), tasks))
+
+def _process_batches_in_pool(columns, batches, workers):
+    """Run process_batch over batches in a pool of workers, yielding results in order."""
+    # Batches are fetched here, in the calling thread (sqlite3 connections
+    # are bound to the thread that opened them), and only a few are in
+    # flight at once, so the rows still stream instead of piling up in the
+    # pool's task queue
+    with multiprocessing.Pool(workers) as pool:
+        pending = collections.deque()
+        for batch in batches:
+            pending.append(pool.apply_async(process_batch, (columns, batch)))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().get()
+        
+        while pending:
+            yield pending.popleft().get()
+
+def create_todoist_csv(columns, batches, output_file):
+    """Create a CSV file formatted for Todoist import.
+    
+    columns and batches are as returned by get_active_tasks.
+    """
+    row_count = 0
+    
+    # Fetch just past the threshold to find out if the export is large
+    # enough to be worth converting in parallel, then put those batches back
+    batches = iter(batches)
+    head = []
+    head_rows = 0
+    for batch in batches:
+        head.append(batch)
+        head_rows += len(batch)
+        if head_rows > PARALLEL_THRESHOLD:
+            break
+    batches = itertools.chain(head, batches)
+    
+    # With a single CPU a pool only adds the cost of sending the batches
+    # between processes
+    workers = os.cpu_count() or 1
+    parallel = workers > 1 and head_rows > PARALLEL_THRESHOLD
     
     try:
-        with open(output_file, 'w', newline='', encoding='utf-8') as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=headers, lineterminator='\n')
-            writer.writeheader()
+        # The rows are simple enough to write as UTF-8 lines directly,
+        # without the csv module's per-field quoting machinery
+        with open(output_file, 'wb', buffering=WRITE_BUFFER_SIZE) as csvfile:
+            csvfile.write(CSV_HEADER.encode('utf-8'))
+            
+            # Each batch is converted, encoded and written with one call
+            # instead of one call per task
+            if parallel:
+                results = _process_batches_in_pool(columns, batches, workers)
+            else:
+                results = map(functools.partial(process_batch, columns), batches)
             
-            for task in tasks:
-                # Get task description (content)
-                content = task[TASK_CONTENT_POS] if task[TASK_CONTENT_POS] else "Untitled Task"
-                
-                # Extract metadata for description
-                description = ""
-                if len(task) > METADATA_POS and task[METADATA_POS]:
-                    file_path, page = decode_metadata(task[METADATA_POS])
-                    if file_path:
-                        # Extract just the filename from the path
-                        file_name = os.path.basename(file_path)
-                        description = f"Supernote Source: {file_name}, Page: {page}"
-                
-                # Get due date
-                due_date = ""
-                if task[DUE_DATE_POS]:
-                    due_date = convert_timestamp_to_date(task[DUE_DATE_POS])
-                
-                # Get reminder date if due date is empty
-                if not due_date and task[REMINDER_DATE_POS]:
-                    due_date = convert_timestamp_to_date(task[REMINDER_DATE_POS])
-                
-                # Write task to CSV - always use priority 4 (lowest)
-                writer.writerow({
-                    'TYPE': 'task',
-                    'CONTENT': content,
-                    'DESCRIPTION': description,
-                    'PRIORITY': 4,  # Default low priority
-                    'DATE': due_date
-                })
-                
-        print(f"Successfully created {output_file} with {len(tasks)} tasks.")
+            for count, text in results:
+                row_count += count
+                csvfile.write(text.encode('utf-8'))
+        
+        print(f"Found {row_count} active tasks.")
+        print(f"Successfully created {output_file} with {row_count} tasks.")
     except Exception as e:
         print(f"Error creating CSV file: {e}")
         sys.exit(1)
@@ -143,29 +306,31 @@ def main():
     # Connect to database
     conn = connect_to_db(db_path)
     
-    # Get active tasks
-    tasks = get_active_tasks(conn)
-    
-    # Show count of tasks found
-    print(f"Found {len(tasks)} active tasks.")
+    # Get active tasks (fetched in batches, not loaded into memory at once)
+    columns, batches = get_active_tasks(conn)
     
     # Debug: Show the first task if available
-    if tasks and len(tasks) > 0:
-        first_task = tasks[0]
+    first_batch = next(batches, None)
+    if first_batch is not None:
+        # Put the first batch back in front of the stream
+        batches = itertools.chain([first_batch], batches)
+        first_task = first_batch[0]
+        
         print("\nFirst task found:")
-        print(f"ID: {first_task[0]}")
-        print(f"Content: {first_task[3]}")
-        print(f"Due Date: {first_task[5]}")
-        print(f"Status: {first_task[8]}")
+        print(f"ID: {first_task[columns['id']]}")
+        print(f"Content (as exported): {first_task[columns['content']]}")
+        print(f"Due/Reminder Date: {first_task[columns['due_date']]}")
+        print(f"Status: {first_task[columns['status']]}")
         
         # Show metadata if available
-        if len(first_task) > 12 and first_task[12]:
-            file_path, page = decode_metadata(first_task[12])
+        metadata = first_task[columns['metadata']]
+        if metadata:
+            file_path, page = decode_metadata(metadata)
             print(f"Source: {file_path}")
             print(f"Page: {page}")
     
-    # Create CSV file
-    create_todoist_csv(tasks, output_file)
+    # Create CSV file (the connection stays open while rows are streamed)
+    create_todoist_csv(columns, batches, output_file)
     
     # Close database connection
     conn.close()